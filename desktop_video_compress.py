@@ -6,46 +6,214 @@ Watches ~/Desktop for video files and compresses them using HandBrake CLI
 
 import os
 import sys
-import time
+import fcntl
+import platform
+import re
+import signal
 import subprocess
 import logging
+import logging.handlers
+import queue
+import atexit
 import asyncio
+import concurrent.futures
+import threading
+import time
+import json
+import hashlib
+import mmap
+import shutil
+import sqlite3
+import functools
+from collections import deque
+from contextlib import closing, contextmanager
 from pathlib import Path
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+try:
+    # Pin the native FSEvents backend on macOS instead of letting watchdog pick
+    from watchdog.observers.fsevents import FSEventsObserver as Observer
+except ImportError:
+    from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+from watchdog.events import PatternMatchingEventHandler
 from desktop_notifier import DesktopNotifier
 from send2trash import send2trash
 
+# User home directory, resolved once for all paths below
+HOME = Path.home()
+
 # Ensure log directory exists
-log_dir = os.path.expanduser('~/Library/Logs')
+log_dir = HOME / 'Library' / 'Logs'
 os.makedirs(log_dir, exist_ok=True)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(log_dir, 'desktop-video-compress.log')),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging. Callers only put records on a queue; a listener thread
+# does the formatting and the file and console writes.
+log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.FileHandler(log_dir / 'desktop-video-compress.log'),
+    logging.StreamHandler()
+]
+for log_handler in log_handlers:
+    log_handler.setFormatter(log_formatter)
+
+log_queue = queue.Queue(-1)
+logging.root.setLevel(logging.INFO)
+logging.root.addHandler(logging.handlers.QueueHandler(log_queue))
+LOG_LISTENER = logging.handlers.QueueListener(log_queue, *log_handlers)
+LOG_LISTENER.start()
+# Stopping the listener writes out any records still queued
+atexit.register(LOG_LISTENER.stop)
 logger = logging.getLogger(__name__)
 
 # Global variable to store HandBrakeCLI path once found
 HANDBRAKE_PATH = None
 
+# Set once check_handbrake_installed() has verified HandBrakeCLI in this process
+_handbrake_version_checked = False
+
+# HandBrake video encoders: VideoToolbox hardware HEVC when the HandBrake build
+# supports it, software x265 otherwise
+HARDWARE_ENCODER = 'vt_h265'
+SOFTWARE_ENCODER = 'x265'
+
+# Encoder chosen by check_handbrake_installed()
+HANDBRAKE_ENCODER = SOFTWARE_ENCODER
+
+# Quality per encoder. x265 uses a constant rate factor (lower is better) while
+# VideoToolbox uses a 0-100 scale (higher is better).
+ENCODER_QUALITY = {
+    HARDWARE_ENCODER: '55',
+    SOFTWARE_ENCODER: '22',
+}
+
+# Cache of the last successful HandBrakeCLI check, reused across restarts
+HANDBRAKE_CACHE_PATH = HOME / 'Library' / 'Caches' / 'desktop-video-compress' / 'handbrake.json'
+
+# Index of previously compressed videos, used to skip re-encoding duplicates
+DEDUP_DB_PATH = HOME / 'Library' / 'Application Support' / 'desktop-video-compress' / 'dedup.sqlite'
+
+# Conversion factor for reporting file sizes in MB
+MB_PER_BYTE = 1 / (1024 * 1024)
+
+# Number of leading bytes hashed when fingerprinting a video
+FINGERPRINT_BYTES = 1 << 20
+
+# Number of trailing HandBrake log lines kept for error reporting
+STDERR_TAIL_LINES = 50
+
+# Minimum seconds between progress notifications for one encode
+PROGRESS_NOTIFY_INTERVAL = 60
+
+# HandBrake progress line, e.g. "Encoding: task 1 of 1, 42.17 % (...)"
+PROGRESS_RE = re.compile(r'Encoding: task \d+ of \d+, (\d+(?:\.\d+)?) %')
+
 # Global notifier instance for desktop notifications
 NOTIFIER = DesktopNotifier(app_name="Desktop Video Compress")
 
 # Supported video file extensions
 # Includes modern formats (mp4, m4v, mov, mkv, webm) and legacy formats (avi, flv, wmv)
 # to ensure compatibility with various recording and conversion tools
-SUPPORTED_VIDEO_EXTENSIONS = {'.mp4', '.m4v', '.mov', '.avi', '.mkv', '.webm', '.flv', '.wmv'}
+SUPPORTED_VIDEO_EXTENSIONS = frozenset({'.mp4', '.m4v', '.mov', '.avi', '.mkv', '.webm', '.flv', '.wmv'})
+
+# Name prefixes of hidden and temporary files (dotfiles, macOS '._' metadata
+# files, Office '~$' lock files) that are never queued even with a video
+# extension. Temporary download suffixes (.crdownload, .part, .download)
+# already fail the extension check.
+IGNORED_NAME_PREFIXES = ('.', '~$')
+
+# Marker appended to the stem of compressed output files
+COMPRESSED_MARKER = '_compressed'
+
+# Filesystem types on which file change notifications are unreliable
+NETWORK_FS_TYPES = {
+    'smbfs', 'nfs', 'nfs4', 'afpfs', 'webdav', 'cifs', 'ftp',
+    'osxfuse', 'macfuse', 'fuse.sshfs',
+}
+
+# Folders backing iCloud Drive and other cloud storage providers
+CLOUD_STORAGE_DIRS = (
+    HOME / 'Library' / 'Mobile Documents',
+    HOME / 'Library' / 'CloudStorage',
+)
+
+# Seconds between Desktop scans when falling back to polling
+POLLING_INTERVAL = 10
+
+# Line of `mount` output, on macOS "<dev> on <dir> (<type>, <flags>)" and on
+# Linux "<dev> on <dir> type <type> (<flags>)"
+MOUNT_LINE_RE = re.compile(
+    r'^.+? on (?P<mount_point>.+?)(?: type (?P<fs_type>\S+))? \((?P<options>[^)]*)\)$'
+)
+
+# Notification state: whether one is being delivered, the latest ordinary
+# (title, message, future) waiting behind it, and every error waiting
+_notification_lock = threading.Lock()
+_notification_in_flight = False
+_pending_notification = None
+_pending_errors = deque()
+
+# Set whenever no notification is being delivered or waiting
+_notifications_idle = threading.Event()
+_notifications_idle.set()
+
+# Darwin task class HandBrake runs under on Apple Silicon (see taskpolicy(8)),
+# e.g. 'utility' or 'background'. Set DVC_TASK_CLASS to an empty string to
+# leave scheduling to the system.
+TASK_CLASS = os.environ.get('DVC_TASK_CLASS', 'utility')
+
+# ffprobe, resolved once. Child processes are launched by absolute path with
+# close_fds=False (our descriptors are non-inheritable anyway, see PEP 446) so
+# that subprocess can use posix_spawn instead of fork+exec.
+FFPROBE_PATH = shutil.which('ffprobe') or 'ffprobe'
+
+# Long-lived event loop that runs encodes and notifications on its own thread
+LOOP = asyncio.new_event_loop()
+threading.Thread(target=LOOP.run_forever, name='event-loop', daemon=True).start()
+
+# Semaphore bounding concurrent encodes, created on LOOP by run()
+ENCODE_SEMAPHORE = None
+
+# Queue of (path, done future) pairs waiting to be encoded, created by run()
+ENCODE_QUEUE = None
+
+# Waiters for each video with a job in progress, keyed by path, so repeated
+# events for a file join the running job instead of starting another
+ACTIVE_JOBS = {}
+
+# Running encode job tasks, cancelled by cancel_jobs() when the service stops
+ENCODE_TASKS = set()
+
+# Seconds to wait on shutdown for cancelled jobs to kill HandBrake and clean up
+SHUTDOWN_TIMEOUT = 10
+
+# Seconds after which the watcher stops treating a queued file as in progress
+# if its job never reported back
+DUPLICATE_EVENT_WINDOW = 60
+
+
+def _ext_lower(name):
+    """Return the lowercased extension of a file name, including the dot.
+    
+    Only the short tail after the last dot is lowercased. Names without an
+    extension (or hidden files such as '.mov') return an empty string, like
+    os.path.splitext.
+    """
+    dot = name.rfind('.')
+    return name[dot:].lower() if dot > 0 else ''
+
+
+def _is_compressed_name(name):
+    """Return True if a file name is one of our outputs (stem ends with the marker)."""
+    dot = name.rfind('.')
+    return name.endswith(COMPRESSED_MARKER, 0, dot if dot > 0 else len(name))
 
 
+@functools.lru_cache(maxsize=1)
 def find_handbrake_cli():
     """Find HandBrakeCLI in common locations.
     
+    The result is memoized; check_handbrake_installed() clears it when nothing
+    was found, and find_handbrake_cli.cache_clear() forces a new search.
+    
     Returns the full path to HandBrakeCLI if found, None otherwise.
     """
     # Common executable names (case variations)
@@ -60,19 +228,9 @@ def find_handbrake_cli():
     
     # First, try to find it in PATH
     for exe_name in executable_names:
-        try:
-            result = subprocess.run(
-                ['which', exe_name],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if result.returncode == 0:
-                path = result.stdout.strip()
-                if os.path.isfile(path):
-                    return path
-        except Exception:
-            pass
+        path = shutil.which(exe_name)
+        if path:
+            return path
     
     # Then check common installation paths
     for search_path in search_paths:
@@ -84,50 +242,245 @@ def find_handbrake_cli():
     return None
 
 
+def load_handbrake_cache():
+    """Load the cached HandBrakeCLI check result.
+    
+    Returns the cached {path, mtime, ino, version, encoder} dict if the
+    cached binary still exists as the same file with the same modification
+    time, None otherwise. Checking the inode catches upgrades that replace
+    the binary but preserve its mtime, as package bottles do.
+    """
+    try:
+        with open(HANDBRAKE_CACHE_PATH) as f:
+            cached = json.load(f)
+        st = os.stat(cached['path'])
+        if (st.st_mtime_ns == cached['mtime'] and st.st_ino == cached['ino']
+                and cached['encoder'] in ENCODER_QUALITY):
+            return cached
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    
+    return None
+
+
+def save_handbrake_cache(path, version, encoder):
+    """Persist a successful HandBrakeCLI check for the next startup.
+    
+    The file is written under a temporary name and renamed into place, so a
+    crash mid-write never leaves a truncated cache behind.
+    """
+    tmp_path = f"{HANDBRAKE_CACHE_PATH}.tmp"
+    try:
+        os.makedirs(os.path.dirname(HANDBRAKE_CACHE_PATH), exist_ok=True)
+        st = os.stat(path)
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'path': path,
+                'mtime': st.st_mtime_ns,
+                'ino': st.st_ino,
+                'version': version,
+                'encoder': encoder,
+            }, f)
+        os.replace(tmp_path, HANDBRAKE_CACHE_PATH)
+    except OSError as e:
+        logger.warning(f"Could not write HandBrake cache: {e}")
+
+
+def detect_encoder():
+    """Choose the video encoder supported by the installed HandBrakeCLI.
+    
+    Returns HARDWARE_ENCODER if it is listed in HandBrakeCLI's help output,
+    SOFTWARE_ENCODER otherwise.
+    """
+    try:
+        result = subprocess.run(
+            [HANDBRAKE_PATH, '--help'],
+            capture_output=True,
+            text=True,
+            close_fds=False,
+            timeout=5
+        )
+        if HARDWARE_ENCODER in result.stdout or HARDWARE_ENCODER in result.stderr:
+            return HARDWARE_ENCODER
+    except Exception as e:
+        logger.warning(f"Could not list HandBrake encoders: {e}")
+    
+    return SOFTWARE_ENCODER
+
+
 def check_handbrake_installed():
-    """Check if HandBrake CLI is installed and available."""
-    global HANDBRAKE_PATH
+    """Check if HandBrake CLI is installed and available.
+    
+    A successful check is remembered for the rest of the process, and across
+    restarts while the binary is unchanged, which skips both the search and
+    the --version subprocess.
+    """
+    global HANDBRAKE_PATH, HANDBRAKE_ENCODER, _handbrake_version_checked
+    
+    if _handbrake_version_checked:
+        return True
+    
+    cached = load_handbrake_cache()
+    if cached is not None:
+        HANDBRAKE_PATH = cached['path']
+        HANDBRAKE_ENCODER = cached['encoder']
+        _handbrake_version_checked = True
+        logger.info(f"HandBrake CLI found at {HANDBRAKE_PATH} (cached): {cached['version']}")
+        logger.info(f"Using video encoder: {HANDBRAKE_ENCODER}")
+        return True
     
     HANDBRAKE_PATH = find_handbrake_cli()
     
     if HANDBRAKE_PATH is None:
+        # Don't remember the miss, so a later check sees a fresh install
+        find_handbrake_cli.cache_clear()
         logger.error("HandBrake CLI not found in PATH or common locations")
         logger.error("Searched locations: /opt/homebrew/bin, /usr/local/bin, /usr/bin")
         send_notification(
             "Desktop Video Compress - Error",
-            "HandBrake CLI is not installed. Please install it using: brew install handbrake"
+            "HandBrake CLI is not installed. Please install it using: brew install handbrake",
+            error=True
         )
         return False
     
     try:
         result = subprocess.run(
             [HANDBRAKE_PATH, '--version'],
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
             text=True,
+            close_fds=False,
             timeout=5
         )
         if result.returncode == 0:
             version_info = result.stdout.split('\n')[0]
             logger.info(f"HandBrake CLI found at {HANDBRAKE_PATH}: {version_info}")
+            HANDBRAKE_ENCODER = detect_encoder()
+            logger.info(f"Using video encoder: {HANDBRAKE_ENCODER}")
+            save_handbrake_cache(HANDBRAKE_PATH, version_info, HANDBRAKE_ENCODER)
+            _handbrake_version_checked = True
             return True
     except Exception as e:
         logger.error(f"Error checking HandBrake at {HANDBRAKE_PATH}: {e}")
         send_notification(
             "Desktop Video Compress - Error",
-            f"Error checking HandBrake: {e}"
+            f"Error checking HandBrake: {e}",
+            error=True
         )
         return False
     
     return False
 
 
-def send_notification(title, message):
-    """Send a desktop notification using desktop-notifier."""
+def send_notification(title, message, error=False):
+    """Send a desktop notification using desktop-notifier.
+    
+    The notification is scheduled on the shared event loop without waiting,
+    so it is safe to call from any thread, including the loop itself.
+    
+    Only one notification is in flight at a time. One requested meanwhile
+    waits for it to finish, replacing any older notification that was still
+    waiting, so a burst collapses to the latest message instead of queueing
+    without bound. Errors (error=True) are never replaced: each one waits in
+    its own queue and is delivered ahead of ordinary notifications.
+    
+    Returns:
+        A concurrent.futures.Future that completes when the notification has
+        been delivered, or is cancelled if a newer one superseded it (never
+        for errors)
+    """
+    global _notification_in_flight, _pending_notification
+    
+    future = concurrent.futures.Future()
+    superseded = None
+    
+    with _notification_lock:
+        if _notification_in_flight:
+            if error:
+                _pending_errors.append((title, message, future))
+            else:
+                superseded = _pending_notification
+                _pending_notification = (title, message, future)
+            dispatch = False
+        else:
+            _notification_in_flight = True
+            _notifications_idle.clear()
+            dispatch = True
+    
+    if superseded is not None:
+        superseded[2].cancel()
+        logger.info(f"Notification superseded: {superseded[0]} - {superseded[1]}")
+    
+    if dispatch:
+        _dispatch_notification(title, message, future)
+    
+    return future
+
+
+def _dispatch_notification(title, message, future):
+    """Schedule a notification on the event loop, resolving future when done."""
     try:
-        asyncio.run(NOTIFIER.send(title=title, message=message))
-        logger.info(f"Notification sent: {title} - {message}")
+        sent = asyncio.run_coroutine_threadsafe(
+            NOTIFIER.send(title=title, message=message),
+            LOOP
+        )
     except Exception as e:
         logger.error(f"Failed to send notification: {e}")
+        future.set_exception(e)
+        _start_pending_notification()
+        return
+    
+    sent.add_done_callback(
+        lambda done: _notification_done(done, title, message, future)
+    )
+
+
+def _notification_done(sent, title, message, future):
+    """Log a delivered notification and start the one waiting behind it."""
+    if sent.cancelled():
+        logger.warning(f"Notification cancelled: {title} - {message}")
+        future.cancel()
+    elif sent.exception() is not None:
+        logger.error(f"Failed to send notification: {sent.exception()}")
+        future.set_exception(sent.exception())
+    else:
+        logger.info(f"Notification sent: {title} - {message}")
+        future.set_result(sent.result())
+    
+    _start_pending_notification()
+
+
+def _start_pending_notification():
+    """Dispatch the next waiting notification, if any, or mark the sender idle.
+    
+    Waiting errors go first, oldest first.
+    """
+    global _notification_in_flight, _pending_notification
+    
+    with _notification_lock:
+        if _pending_errors:
+            pending = _pending_errors.popleft()
+        else:
+            pending = _pending_notification
+            _pending_notification = None
+        if pending is None:
+            _notification_in_flight = False
+            _notifications_idle.set()
+    
+    if pending is not None:
+        _dispatch_notification(*pending)
+
+
+def flush_notifications(timeout=5):
+    """Wait until every requested notification has been delivered or dropped.
+    
+    Notifications are sent on the background loop's daemon thread, so call
+    this before exiting or they may be lost.
+    
+    Returns:
+        True if the notifications finished within timeout seconds
+    """
+    return _notifications_idle.wait(timeout)
 
 
 def move_to_trash(file_path):
@@ -146,7 +499,8 @@ def move_to_trash(file_path):
             return False
         
         # Use Send2Trash to move file to trash
-        # This is cross-platform and preserves the ability to restore files
+        # This is cross-platform and preserves the ability to restore files.
+        # On macOS it calls NSFileManager in-process when pyobjc is installed.
         send2trash(str(file_path))
         logger.info(f"Moved to trash: {file_path}")
         return True
@@ -156,26 +510,315 @@ def move_to_trash(file_path):
         return False
 
 
-def compress_video(input_path):
+def video_fingerprint(file_path, st=None):
+    """Fingerprint a video by size, modification time and a hash of its head.
+    
+    Args:
+        file_path: Path of the video
+        st: os.stat_result for the video, if the caller already has one
+        
+    Returns:
+        A (size, mtime_ns, sha256 hex digest of the first 1MB) tuple
+    """
+    if st is None:
+        st = os.stat(file_path)
+    
+    with open(file_path, 'rb') as f:
+        if st.st_size <= FINGERPRINT_BYTES and hasattr(hashlib, 'file_digest'):
+            # Whole file fits in the head: let OpenSSL read and hash it directly
+            digest = hashlib.file_digest(f, 'sha256')
+        else:
+            digest = hashlib.sha256()
+            if st.st_size > 0:
+                length = min(st.st_size, FINGERPRINT_BYTES)
+                with mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ) as head:
+                    # Hash the mapped pages in place, without copying the head
+                    digest.update(memoryview(head))
+    
+    return (st.st_size, st.st_mtime_ns, digest.hexdigest())
+
+
+def _open_dedup_db():
+    """Open the dedup index, creating it if needed."""
+    os.makedirs(os.path.dirname(DEDUP_DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(DEDUP_DB_PATH)
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS compressed ('
+        ' size INTEGER NOT NULL,'
+        ' mtime_ns INTEGER NOT NULL,'
+        ' head_sha256 TEXT NOT NULL,'
+        ' output_path TEXT NOT NULL,'
+        ' PRIMARY KEY (size, mtime_ns, head_sha256))'
+    )
+    return conn
+
+
+def find_previous_output(fingerprint):
+    """Return the existing compressed output for a fingerprint, or None."""
+    with closing(_open_dedup_db()) as conn:
+        row = conn.execute(
+            'SELECT output_path FROM compressed'
+            ' WHERE size = ? AND mtime_ns = ? AND head_sha256 = ?',
+            fingerprint
+        ).fetchone()
+    
+    if row is not None and os.path.isfile(row[0]):
+        return Path(row[0])
+    return None
+
+
+def record_output(fingerprint, output_path):
+    """Remember the compressed output produced for a fingerprint."""
+    with closing(_open_dedup_db()) as conn:
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO compressed VALUES (?, ?, ?, ?)',
+                (*fingerprint, str(output_path))
+            )
+
+
+def link_or_copy(src, dst):
+    """Hard link src to dst, copying instead when a link is not possible."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def task_policy_prefix():
+    """Return the taskpolicy command prefix for HandBrake on Apple Silicon.
+    
+    Returns an empty list on other platforms or when DVC_TASK_CLASS is empty.
+    """
+    if sys.platform != 'darwin' or platform.machine() != 'arm64' or not TASK_CLASS:
+        return []
+    return ['/usr/sbin/taskpolicy', '-c', TASK_CLASS]
+
+
+def needs_compression(file_path, threshold_kbps=4000):
+    """Check whether a video's bitrate is high enough to be worth compressing.
+    
+    Uses ffprobe to read the video stream's bitrate (falling back to the
+    container's overall bitrate). If ffprobe is unavailable or the bitrate
+    cannot be determined, the video is assumed to need compression.
+    
+    Returns:
+        False if the video bitrate is below threshold_kbps, True otherwise
+    """
+    try:
+        result = subprocess.run(
+            [
+                FFPROBE_PATH, '-v', 'error',
+                '-select_streams', 'v:0',
+                '-show_entries', 'stream=bit_rate,width,height:format=bit_rate',
+                '-of', 'json',
+                str(file_path)
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            close_fds=False,
+            timeout=10
+        )
+        info = json.loads(result.stdout)
+    except (OSError, subprocess.TimeoutExpired, ValueError) as e:
+        logger.debug(f"ffprobe unavailable for {file_path}: {e}")
+        return True
+    
+    stream = (info.get('streams') or [{}])[0]
+    bit_rate = stream.get('bit_rate') or info.get('format', {}).get('bit_rate')
+    try:
+        kbps = int(bit_rate) / 1000
+    except (TypeError, ValueError):
+        return True
+    
+    if kbps < threshold_kbps:
+        logger.info(
+            f"Bitrate {kbps:.0f} kbps ({stream.get('width')}x{stream.get('height')}) "
+            f"is below {threshold_kbps} kbps: {file_path}"
+        )
+        return False
+    return True
+
+
+async def _collect_tail(stream, tail):
+    """Read HandBrake's log output, keeping only the last lines in `tail`.
+    
+    Reads in chunks rather than by line, so an overlong line can't end the
+    reader and leave HandBrake blocked on a full pipe.
+    """
+    pending = ''
+    
+    while True:
+        chunk = await stream.read(4096)
+        if not chunk:
+            break
+        
+        *lines, pending = (pending + chunk.decode(errors='replace')).split('\n')
+        tail.extend(line.rstrip() for line in lines)
+    
+    if pending:
+        tail.append(pending.rstrip())
+
+
+async def _watch_progress(stream, input_path):
+    """Parse HandBrake progress output and send throttled progress notifications."""
+    loop = asyncio.get_running_loop()
+    next_notify = loop.time() + PROGRESS_NOTIFY_INTERVAL
+    pending = ''
+    
+    while True:
+        chunk = await stream.read(4096)
+        if not chunk:
+            return
+        
+        # Progress updates are separated by carriage returns, so only keep
+        # the unterminated remainder between reads
+        pending += chunk.decode(errors='replace')
+        matches = PROGRESS_RE.findall(pending)
+        pending = pending[max(pending.rfind('\r'), pending.rfind('\n')) + 1:]
+        
+        if matches and loop.time() >= next_notify:
+            next_notify = loop.time() + PROGRESS_NOTIFY_INTERVAL
+            send_notification(
+                "Desktop Video Compress",
+                f"Compressing {input_path.name}: {float(matches[-1]):.0f}%"
+            )
+
+
+def _output_path_for(path):
+    """Return the compressed output path (a string) for a video path string."""
+    dirname, base = os.path.split(path)
+    root, ext = os.path.splitext(base)
+    return os.path.join(dirname, root + COMPRESSED_MARKER + ext)
+
+
+def compression_skip_reason(path):
+    """Decide whether a video should be skipped.
+    
+    Returns:
+        A log message explaining why the file is skipped, or None if it
+        should be compressed
+    """
+    # Skip our own output files
+    if _is_compressed_name(os.path.basename(path)):
+        return f"Skipping already compressed file: {path}"
+    
+    # Skip if already processed
+    output_path = _output_path_for(path)
+    if os.path.exists(output_path):
+        return f"Compressed file already exists: {output_path}"
+    
+    return None
+
+
+@contextmanager
+def encode_lock(output_path):
+    """Hold an advisory lock on producing output_path.
+    
+    The lock is a hidden lock file next to the output, locked with flock so
+    that several running copies of the service never encode the same file.
+    Yields True if the lock was acquired, False if it is held elsewhere.
+    
+    The holder removes the lock file when done. A process that opened the
+    file before that could still lock the unlinked inode afterwards, while
+    another locks a fresh file at the same path; so a lock only counts once
+    the locked descriptor is confirmed to still be the file at lock_path.
+    """
+    dirname, base = os.path.split(output_path)
+    lock_path = os.path.join(dirname, f".{base}.lock")
+    
+    while True:
+        fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            yield False
+            return
+        
+        locked = os.fstat(fd)
+        try:
+            current = os.stat(lock_path)
+        except FileNotFoundError:
+            current = None
+        if current is not None and (current.st_dev, current.st_ino) == (locked.st_dev, locked.st_ino):
+            break
+        
+        # Locked a lock file that has since been removed; try the new one
+        os.close(fd)
+    
+    try:
+        try:
+            yield True
+        finally:
+            # Remove the lock file while still holding the lock
+            try:
+                os.unlink(lock_path)
+            except FileNotFoundError:
+                pass
+    finally:
+        os.close(fd)
+
+
+async def compress_video(input_path):
     """Compress video file using HandBrake CLI."""
     input_path = Path(input_path)
     
-    # Skip if file doesn't exist or is already compressed
-    if not input_path.exists():
+    # Skip if file doesn't exist or is already compressed. This is the only
+    # stat of the input; its result is reused for fingerprinting and stats.
+    try:
+        st_in = os.stat(input_path)
+    except FileNotFoundError:
         logger.warning(f"File not found: {input_path}")
         return
     
-    # Create output filename with _compressed suffix
-    output_path = input_path.parent / f"{input_path.stem}_compressed{input_path.suffix}"
-    
-    # Skip if already processed
-    if output_path.exists():
-        logger.info(f"Compressed file already exists: {output_path}")
+    skip_reason = compression_skip_reason(str(input_path))
+    if skip_reason is not None:
+        logger.info(skip_reason)
         return
     
-    # Skip if filename already contains _compressed
-    if '_compressed' in input_path.stem:
-        logger.info(f"Skipping already compressed file: {input_path}")
+    output_path = _output_path_for(str(input_path))
+    
+    with encode_lock(output_path) as acquired:
+        if not acquired:
+            logger.info(f"Already being compressed elsewhere: {input_path}")
+            return
+        
+        # Another instance may have finished while this one was waiting
+        if os.path.exists(output_path):
+            logger.info(f"Compressed file already exists: {output_path}")
+            return
+        
+        await _encode_video(input_path, output_path, st_in)
+
+
+async def _encode_video(input_path, output_path, st_in):
+    """Produce output_path from input_path, reusing a duplicate's output if possible."""
+    # Reuse the output of an earlier encode of the same content
+    try:
+        fingerprint = await asyncio.to_thread(video_fingerprint, input_path, st_in)
+        previous_output = await asyncio.to_thread(find_previous_output, fingerprint)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        logger.warning(f"Duplicate check failed for {input_path}: {e}")
+        fingerprint = previous_output = None
+    
+    if previous_output is not None:
+        try:
+            link_or_copy(previous_output, output_path)
+        except OSError as e:
+            logger.warning(f"Could not reuse {previous_output}, compressing instead: {e}")
+        else:
+            message = f"Reused existing compression of {input_path.name} from {previous_output.name}"
+            logger.info(message)
+            send_notification("Desktop Video Compress - Complete", message)
+            if not move_to_trash(input_path):
+                logger.warning(f"Failed to move original file to Trash: {input_path}")
+            return
+    
+    # Skip videos that are already efficiently encoded
+    if not await asyncio.to_thread(needs_compression, input_path):
+        logger.info(f"Skipping already well-compressed file: {input_path}")
         return
     
     logger.info(f"Starting compression: {input_path}")
@@ -184,103 +827,393 @@ def compress_video(input_path):
         f"Starting compression of {input_path.name}"
     )
     
+    succeeded = False
+    
     try:
         # HandBrake CLI command for web-optimized compression
-        # Using Fast 2160p60 4K HEVC preset for 4K 60fps content
-        cmd = [
+        # Using Fast 2160p60 4K HEVC preset for 4K 60fps content, encoded on
+        # the VideoToolbox hardware encoder when available
+        cmd = task_policy_prefix() + [
             HANDBRAKE_PATH,
             '-i', str(input_path),
-            '-o', str(output_path),
+            '-o', output_path,
             '--preset', 'Fast 2160p60 4K HEVC',
             '--optimize',
-            '--encoder', 'x265',
-            '--quality', '22'
+            '--encoder', HANDBRAKE_ENCODER,
+            '--quality', ENCODER_QUALITY[HANDBRAKE_ENCODER]
         ]
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=3600  # 1 hour timeout
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            close_fds=False
         )
         
-        if result.returncode == 0:
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        readers = [
+            asyncio.create_task(_watch_progress(proc.stdout, input_path)),
+            asyncio.create_task(_collect_tail(proc.stderr, stderr_tail)),
+        ]
+        
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=3600)  # 1 hour timeout
+            reader_results = await asyncio.gather(*readers, return_exceptions=True)
+        except BaseException:
+            # Timed out, or the service is stopping: don't leave HandBrake running
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
+        finally:
+            for reader in readers:
+                reader.cancel()
+        
+        # HandBrake's exit status alone decides success; a failed reader only
+        # costs progress updates or log lines
+        for result in reader_results:
+            if isinstance(result, Exception):
+                logger.warning(f"Could not read HandBrake output for {input_path}: {result}")
+        
+        if proc.returncode == 0:
+            succeeded = True
+            
             # Get file sizes
-            original_size = input_path.stat().st_size / (1024 * 1024)  # MB
-            compressed_size = output_path.stat().st_size / (1024 * 1024)  # MB
-            savings = ((original_size - compressed_size) / original_size) * 100
+            original_size = st_in.st_size * MB_PER_BYTE
+            compressed_size = os.stat(output_path).st_size * MB_PER_BYTE
+            savings = ((original_size - compressed_size) / original_size) * 100 if original_size else 0.0
             
             message = f"Compressed {input_path.name}\nOriginal: {original_size:.1f}MB → Compressed: {compressed_size:.1f}MB ({savings:.1f}% savings)"
             logger.info(message)
             send_notification("Desktop Video Compress - Complete", message)
             
+            if fingerprint is not None:
+                try:
+                    record_output(fingerprint, output_path)
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not record {output_path} in dedup index: {e}")
+            
             # Move original file to Trash
             if move_to_trash(input_path):
                 logger.info(f"Original file moved to Trash: {input_path}")
             else:
                 logger.warning(f"Failed to move original file to Trash: {input_path}")
         else:
-            error_msg = f"Compression failed: {result.stderr}"
+            error_msg = "Compression failed:\n" + "\n".join(stderr_tail)
             logger.error(error_msg)
-            send_notification("Desktop Video Compress - Error", f"Failed to compress {input_path.name}")
+            send_notification("Desktop Video Compress - Error", f"Failed to compress {input_path.name}", error=True)
             
-    except subprocess.TimeoutExpired:
+    except asyncio.TimeoutError:
         logger.error(f"Compression timed out for {input_path}")
-        send_notification("Desktop Video Compress - Error", f"Compression timed out for {input_path.name}")
+        send_notification("Desktop Video Compress - Error", f"Compression timed out for {input_path.name}", error=True)
     except Exception as e:
         logger.error(f"Error compressing video: {e}")
-        send_notification("Desktop Video Compress - Error", f"Error: {str(e)}")
+        send_notification("Desktop Video Compress - Error", f"Error: {str(e)}", error=True)
+    finally:
+        # A partial output would otherwise be mistaken for a finished one
+        if not succeeded:
+            try:
+                os.unlink(output_path)
+                logger.info(f"Removed incomplete output: {output_path}")
+            except FileNotFoundError:
+                pass
 
 
-class DesktopVideoHandler(FileSystemEventHandler):
-    """Handler for desktop video file events."""
-    
-    def __init__(self):
-        super().__init__()
-        self.processing = set()
+async def enqueue(input_path):
+    """Queue a video for compression and wait until it has been processed."""
+    done = asyncio.get_running_loop().create_future()
+    await ENCODE_QUEUE.put((Path(input_path), done))
+    await done
+
+
+async def encode_worker():
+    """Drain the encode queue, starting a job per video in arrival order.
     
-    def on_created(self, event):
-        """Handle file creation events."""
-        if event.is_directory:
-            return
-        
-        file_path = Path(event.src_path)
-        
-        # Only process supported video files
-        if file_path.suffix.lower() not in SUPPORTED_VIDEO_EXTENSIONS:
-            return
+    A video that already has a job in progress is not started again; its
+    waiter joins the running job instead.
+    """
+    while True:
+        input_path, done = await ENCODE_QUEUE.get()
         
-        # Skip if already processing
-        if str(file_path) in self.processing:
-            return
+        waiters = ACTIVE_JOBS.get(input_path)
+        if waiters is not None:
+            waiters.append(done)
+            continue
         
-        # Wait a bit to ensure file is fully written
-        time.sleep(2)
+        ACTIVE_JOBS[input_path] = [done]
+        task = asyncio.create_task(_run_job(input_path))
+        ENCODE_TASKS.add(task)
+        task.add_done_callback(ENCODE_TASKS.discard)
+
+
+async def cancel_jobs(timeout=SHUTDOWN_TIMEOUT):
+    """Cancel the running encode jobs and wait for them to clean up.
+    
+    Cancelled jobs kill their HandBrake process and remove its partial output
+    and the encode lock before they finish.
+    """
+    tasks = list(ENCODE_TASKS)
+    for task in tasks:
+        task.cancel()
+    
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning(f"{len(pending)} encode job(s) did not stop within {timeout}s")
+
+
+async def wait_until_stable(path, interval=0.3, stable_for=2, timeout=60):
+    """Wait until a file has stopped growing.
+    
+    Polls the file size every `interval` seconds until it has been unchanged
+    for `stable_for` consecutive samples. An empty file is never considered
+    stable, since recorders often create the file before writing to it.
+    
+    Returns:
+        True once the size is stable, False if the file disappears or
+        `timeout` seconds pass first
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    size = None
+    unchanged = 0
+    
+    while loop.time() < deadline:
+        try:
+            current = path.stat().st_size
+        except FileNotFoundError:
+            return False
         
-        # Mark as processing
-        self.processing.add(str(file_path))
+        if current == size and current > 0:
+            unchanged += 1
+            if unchanged >= stable_for:
+                return True
+        else:
+            size = current
+            unchanged = 0
         
+        await asyncio.sleep(interval)
+    
+    return False
+
+
+async def _run_job(input_path):
+    """Compress one queued video, then release everything waiting on it."""
+    try:
+        # Settle before taking an encode slot so waiting never blocks one.
+        # A file still being written (e.g. a long recording) is waited on for
+        # as long as it keeps changing; encoding it early would trash a file
+        # the recorder is still writing.
+        waited = False
+        while not await wait_until_stable(input_path):
+            try:
+                size = input_path.stat().st_size
+            except FileNotFoundError:
+                return
+            if size == 0 and waited:
+                logger.info(f"Skipping file that stayed empty: {input_path}")
+                return
+            if not waited:
+                logger.info(f"File still changing, waiting for it to finish: {input_path}")
+                waited = True
+        async with ENCODE_SEMAPHORE:
+            await compress_video(input_path)
+    finally:
+        for done in ACTIVE_JOBS.pop(input_path, []):
+            if not done.done():
+                done.set_result(None)
+
+
+def max_concurrent_encodes():
+    """Return how many HandBrake encodes may run at the same time.
+    
+    The DVC_MAX_JOBS environment variable wins when set to a whole number; an
+    invalid value is logged and ignored. Otherwise hardware encodes run one at
+    a time, since they share the Mac's media engine and parallel jobs only
+    compete for it. Software x265 encodes run one per 6 cores, as a single
+    x265 encode rarely keeps more than ~6 cores busy.
+    """
+    max_jobs = os.environ.get('DVC_MAX_JOBS')
+    if max_jobs:
         try:
-            compress_video(file_path)
-        finally:
-            # Remove from processing set
-            self.processing.discard(str(file_path))
+            return max(1, int(max_jobs))
+        except ValueError:
+            logger.error(f"Ignoring DVC_MAX_JOBS={max_jobs!r}: not a whole number")
+    if HANDBRAKE_ENCODER == HARDWARE_ENCODER:
+        return 1
+    return max(1, (os.cpu_count() or 1) // 6)
+
+
+async def run(max_jobs):
+    """Run the encode queue, with up to max_jobs encodes at once, until stopped."""
+    global ENCODE_SEMAPHORE, ENCODE_QUEUE
+    
+    ENCODE_SEMAPHORE = asyncio.Semaphore(max_jobs)
+    ENCODE_QUEUE = asyncio.Queue()
+    logger.info(f"Running up to {max_jobs} concurrent encode(s)")
+    
+    # Videos are added to the queue by DesktopVideoHandler
+    await encode_worker()
+
+
+class DesktopVideoHandler(PatternMatchingEventHandler):
+    """Handler for desktop video file events.
+    
+    Only creation events for supported video files reach on_created; other
+    files and directories are filtered out by the pattern matching.
+    """
+    
+    def __init__(self):
+        super().__init__(
+            patterns=[f'*{ext}' for ext in SUPPORTED_VIDEO_EXTENSIONS],
+            ignore_directories=True,
+            case_sensitive=False
+        )
+        # Path string -> monotonic time it was last queued, shared between
+        # the observer thread and the startup sweep
+        self.processing = {}
+        self.processing_lock = threading.Lock()
     
-    def on_modified(self, event):
-        """Handle file modification events."""
-        # Treat modifications as potential new files (for edge cases)
-        if event.is_directory:
+    def dispatch(self, event, _exts=SUPPORTED_VIDEO_EXTENSIONS):
+        """Drop events for non-video files before watchdog's pattern matching.
+        
+        Most Desktop events are screenshots, downloads and .DS_Store writes;
+        a plain string check on the extension rejects them without building
+        the path objects the pattern matcher uses. The extension set is bound
+        as a default argument so the check is a local lookup. Hidden and
+        temporary files are dropped next.
+        """
+        src = event.src_path
+        if _ext_lower(src) not in _exts:
+            return
+        if src[src.rfind(os.sep) + 1:].startswith(IGNORED_NAME_PREFIXES):
+            return
+        super().dispatch(event)
+    
+    def on_created(self, event):
+        """Handle file creation events."""
+        # Skip our own output files without a trip through the encode queue
+        if _is_compressed_name(os.path.basename(event.src_path)):
             return
         
-        file_path = Path(event.src_path)
+        self.queue_video(event.src_path)
+    
+    def queue_video(self, file_path):
+        """Hand a video to the encode queue on the event loop.
         
-        # Only process supported video files
-        if file_path.suffix.lower() not in SUPPORTED_VIDEO_EXTENSIONS:
-            return
+        A file whose job is still in progress is dropped here, so bursts of
+        events for one file cost no trip to the event loop. The entry is
+        removed when the job ends, so a new file saved under the same name is
+        queued again; entries also expire after DUPLICATE_EVENT_WINDOW seconds
+        in case a job never reports back. Anything that slips through is
+        still merged by the queue, and the encode lock stops a second encode.
+        """
+        key = os.fspath(file_path)
+        now = time.monotonic()
         
-        # Skip if already processing or already compressed
-        if str(file_path) in self.processing or '_compressed' in file_path.stem:
-            return
+        with self.processing_lock:
+            queued_at = self.processing.get(key)
+            if queued_at is not None and now - queued_at < DUPLICATE_EVENT_WINDOW:
+                logger.debug(f"Already queued, ignoring event: {key}")
+                return
+            # Forget expired entries so the dict does not grow without bound
+            self.processing = {
+                path: t for path, t in self.processing.items()
+                if now - t < DUPLICATE_EVENT_WINDOW
+            }
+            self.processing[key] = now
+        
+        queued = asyncio.run_coroutine_threadsafe(enqueue(file_path), LOOP)
+        queued.add_done_callback(lambda _: self._job_finished(key, now))
+    
+    def _job_finished(self, key, queued_at):
+        """Forget a queued file once its job has ended."""
+        with self.processing_lock:
+            # A later event may have queued the file again since
+            if self.processing.get(key) == queued_at:
+                del self.processing[key]
+
+
+def is_local_fs(path):
+    """Check whether a directory is on a local filesystem.
+    
+    Directories inside iCloud Drive or other cloud storage folders, and those
+    on network mounts (SMB, NFS, AFP, WebDAV, ...), are not local; file system
+    events there are unreliable. When the filesystem type cannot be
+    determined the directory is assumed to be local.
+    """
+    resolved = Path(os.path.realpath(path))
+    
+    for cloud_dir in CLOUD_STORAGE_DIRS:
+        if resolved == cloud_dir or cloud_dir in resolved.parents:
+            return False
+    
+    # Find the mount point holding the directory
+    mount_point = resolved
+    while not os.path.ismount(mount_point):
+        mount_point = mount_point.parent
+    
+    try:
+        result = subprocess.run(
+            ['mount'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            close_fds=False,
+            timeout=5
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Could not determine filesystem type of {path}: {e}")
+        return True
+    
+    return mount_fs_type(result.stdout, str(mount_point)) not in NETWORK_FS_TYPES
+
+
+def mount_fs_type(mount_output, mount_point):
+    """Return the filesystem type `mount` output lists for a mount point.
+    
+    macOS gives the type as the first entry in parentheses, Linux after
+    "type". Returns None if the mount point is not listed.
+    """
+    for line in mount_output.splitlines():
+        match = MOUNT_LINE_RE.match(line)
+        if match and match.group('mount_point') == mount_point:
+            return match.group('fs_type') or match.group('options').split(',')[0].strip()
+    
+    return None
+
+
+def find_existing_videos(directory):
+    """Find uncompressed supported videos already present in a directory.
+    
+    Uses a single os.scandir pass so that files added while the service was
+    not running can be picked up at startup.
+    
+    Returns:
+        List of Path objects for the videos found
+    """
+    videos = []
+    
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if _ext_lower(entry.name) not in SUPPORTED_VIDEO_EXTENSIONS:
+                continue
+            if entry.name.startswith(IGNORED_NAME_PREFIXES):
+                continue
+            if _is_compressed_name(entry.name) or not entry.is_file():
+                continue
+            videos.append(Path(entry.path))
+    
+    return videos
+
+
+def _log_run_failure(run_future):
+    """Log the error if the encode queue stopped with one."""
+    if not run_future.cancelled() and run_future.exception() is not None:
+        logger.error(
+            "Encode queue stopped unexpectedly",
+            exc_info=run_future.exception()
+        )
 
 
 def main():
@@ -290,13 +1223,15 @@ def main():
     # Check if HandBrake is installed
     if not check_handbrake_installed():
         logger.error("Exiting: HandBrake CLI is not available")
+        flush_notifications()
         sys.exit(1)
     
     # Get Desktop path
-    desktop_path = os.path.expanduser('~/Desktop')
+    desktop_path = HOME / 'Desktop'
     
-    if not os.path.exists(desktop_path):
+    if not desktop_path.exists():
         logger.error(f"Desktop path not found: {desktop_path}")
+        flush_notifications()
         sys.exit(1)
     
     logger.info(f"Watching for video files in: {desktop_path}")
@@ -305,24 +1240,58 @@ def main():
         "Now watching Desktop for video files"
     )
     
+    # Start the encode queue on the shared event loop
+    run_future = asyncio.run_coroutine_threadsafe(run(max_concurrent_encodes()), LOOP)
+    run_future.add_done_callback(_log_run_failure)
+    
     # Set up file watcher
     event_handler = DesktopVideoHandler()
-    observer = Observer()
-    observer.schedule(event_handler, desktop_path, recursive=False)
+    if is_local_fs(desktop_path):
+        observer = Observer()
+    else:
+        logger.warning(
+            f"Desktop is on a network or cloud filesystem; "
+            f"scanning for new videos every {POLLING_INTERVAL}s"
+        )
+        observer = PollingObserver(timeout=POLLING_INTERVAL)
+    observer.schedule(event_handler, str(desktop_path), recursive=False)
     observer.start()
     
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        logger.info("Stopping Desktop Video Compress")
-        observer.stop()
-        send_notification(
-            "Desktop Video Compress",
-            "Stopped watching Desktop"
-        )
+    # Pick up videos that arrived while the service was not running. The sweep
+    # runs after the observer has started so that a video saved in between is
+    # not missed; one seen by both is dropped by the handler as a duplicate.
+    existing_videos = find_existing_videos(desktop_path)
+    if existing_videos:
+        logger.info(f"Found {len(existing_videos)} existing video(s) to compress")
+    for file_path in existing_videos:
+        event_handler.queue_video(file_path)
+    
+    # Block until SIGINT (Ctrl-C) or SIGTERM (launchctl unload). The handler
+    # only sets an event, so repeated signals are harmless; the observer is
+    # stopped once, from here.
+    stop_requested = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stop_requested.set())
+    while not stop_requested.wait(1):
+        pass
     
+    observer.stop()
     observer.join()
+    
+    logger.info("Stopping Desktop Video Compress")
+    run_future.cancel()
+    
+    # Stop encodes in progress so no HandBrake process or partial output is
+    # left behind
+    asyncio.run_coroutine_threadsafe(cancel_jobs(), LOOP).result()
+    
+    send_notification(
+        "Desktop Video Compress",
+        "Stopped watching Desktop"
+    )
+    
+    # Give the final notifications a chance to be delivered before exiting
+    flush_notifications()
 
 
 if __name__ == '__main__':
@@ -1,17 +1,99 @@
 #!/usr/bin/env python3
 """
 Test script for desktop_video_compress.py
+
+Set SKIP_ENV_TESTS=1 to skip the tests whose outcome only depends on whether
+HandBrake is installed (e.g. in CI, where it is known to be absent).
 """
 
 import sys
 import os
+import re
+import asyncio
+import hashlib
+import json
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, call, patch
 from pathlib import Path
+from types import SimpleNamespace
+
+# Add this file's directory to path
+_TEST_DIR = os.path.dirname(__file__)
+sys.path.insert(0, _TEST_DIR if os.path.isabs(_TEST_DIR) else os.path.abspath(_TEST_DIR))
+
+from watchdog.events import DirCreatedEvent, FileCreatedEvent
+
+from desktop_video_compress import COMPRESSED_MARKER, IGNORED_NAME_PREFIXES, NOTIFIER, check_handbrake_installed, send_notification, flush_notifications, DesktopVideoHandler, find_handbrake_cli, SUPPORTED_VIDEO_EXTENSIONS, move_to_trash, wait_until_stable, find_existing_videos, encode_lock, is_local_fs, mount_fs_type, CLOUD_STORAGE_DIRS, NETWORK_FS_TYPES, video_fingerprint, find_previous_output, record_output, load_handbrake_cache, save_handbrake_cache, SOFTWARE_ENCODER
 
-# Add current directory to path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# Output lines, written out in one go at the end of main() instead of one
+# print() per line
+_LOG: list[str] = []
 
-from desktop_video_compress import check_handbrake_installed, send_notification, DesktopVideoHandler, find_handbrake_cli, SUPPORTED_VIDEO_EXTENSIONS, move_to_trash
+# Fixed parts of the report, encoded once
+_BANNER = b'=' * 60 + b'\n'
+_TITLE = b'Desktop Video Compress - Test Suite\n'
+
+# Tests run concurrently; each worker thread collects its own test's lines
+# so the report keeps the tests in order
+_local = threading.local()
+
+def log(line):
+    """Record a line of test output."""
+    getattr(_local, 'lines', _LOG).append(line)
+
+def run_test(test_func):
+    """Run one test, returning its result and the lines it logged."""
+    _local.lines = []
+    try:
+        result = test_func()
+    except Exception as e:
+        log(f"\nTest {test_func.__name__} raised exception: {e}")
+        result = False
+    finally:
+        lines = _local.lines
+        del _local.lines
+    return result, lines
+
+# Names the service should process, for the filtering test, built from the
+# service's own rules: no hidden or temporary prefix, a stem that does not end
+# with the compressed marker, and a supported extension in any case
+_PRED = re.compile(
+    '^(?!' + '|'.join(re.escape(prefix) for prefix in IGNORED_NAME_PREFIXES) + ')'
+    + '(?!.*' + re.escape(COMPRESSED_MARKER) + r'\.[^.]*$)'
+    + r'.+\.(?i:'
+    + '|'.join(re.escape(ext.lstrip('.')) for ext in sorted(SUPPORTED_VIDEO_EXTENSIONS))
+    + r')$'
+)
+
+# File names and whether the service should process them, for the filtering test
+_CASES = (
+    ("test.mov", True),
+    ("test.MOV", True),
+    ("test.mp4", True),
+    ("test.MP4", True),
+    ("test.m4v", True),
+    ("test.avi", True),
+    ("test.mkv", True),
+    ("test.webm", True),
+    ("test.flv", True),
+    ("test.wmv", True),
+    ("test.txt", False),
+    ("test.jpg", False),
+    ("test.pdf", False),
+    ("test_compressed.mov", False),
+    ("test_compressed.mp4", False),
+    ("my_compressed_clip.mov", True),
+    ("Clip_compressed.MOV", False),
+    ("._clip.mov", False),
+    (".clip.mp4", False),
+    ("~$clip.mov", False),
+    ("clip.mov.crdownload", False),
+)
+
+# Verdict suffixes for the per-case lines of the filtering test
+_PROC, _SKIP = ' process', ' skip'
 
 def test_handbrake_check():
     """Test HandBrake availability check.
@@ -19,141 +101,405 @@ def test_handbrake_check():
     Note: This test checks if HandBrake can be found in common locations.
     The result may vary depending on the test environment.
     """
-    print("Test 1: HandBrake availability check")
+    log("Test 1: HandBrake availability check")
+    if os.environ.get('SKIP_ENV_TESTS'):
+        log("  Result: SKIPPED (SKIP_ENV_TESTS is set)")
+        return True
     result = check_handbrake_installed()
     # The result depends on whether HandBrake is actually installed
-    print(f"  Result: {'Found' if result else 'Not found'} - This is expected based on your system")
+    log(f"  Result: {'Found' if result else 'Not found'} - This is expected based on your system")
     return True  # Pass regardless, as this is environment-dependent
 
 def test_find_handbrake():
     """Test HandBrake path finding."""
-    print("\nTest 2: HandBrake path finding")
-    path = find_handbrake_cli()
-    if path:
-        print(f"  Found HandBrake at: {path}")
-    else:
-        print("  HandBrake not found in common locations (expected in test environment)")
-    print("  Result: PASS (function executed without error)")
+    log("\nTest 2: HandBrake path finding")
+    if not os.environ.get('SKIP_ENV_TESTS'):
+        path = find_handbrake_cli()
+        if path:
+            log(f"  Found HandBrake at: {path}")
+        else:
+            log("  HandBrake not found in common locations (expected in test environment)")
+        
+        # The search is memoized, so asking again must not search again
+        hits = find_handbrake_cli.cache_info().hits
+        if find_handbrake_cli() != path or find_handbrake_cli.cache_info().hits <= hits:
+            log("  Result: FAIL (repeated search was not served from the cache)")
+            return False
+    
+    # A failed check must not leave the miss cached, or installing HandBrake
+    # later would go unnoticed
+    find_handbrake_cli.cache_clear()
+    with patch('desktop_video_compress._handbrake_version_checked', False), \
+            patch('desktop_video_compress.HANDBRAKE_PATH', None), \
+            patch('desktop_video_compress.load_handbrake_cache', return_value=None), \
+            patch('desktop_video_compress.send_notification'), \
+            patch('shutil.which', return_value=None), \
+            patch('os.path.isfile', return_value=False):
+        found = check_handbrake_installed()
+        stale = find_handbrake_cli.cache_info().currsize
+    find_handbrake_cli.cache_clear()
+    if found or stale:
+        log("  Result: FAIL (a missing HandBrake was cached)")
+        return False
+    log("  Result: PASS (repeat call cached, a miss is not)")
     return True
 
 def test_notification():
     """Test notification function."""
-    print("\nTest 3: Notification function")
+    log("\nTest 3: Notification function")
     try:
-        send_notification("Test Title", "Test Message")
-        print("  Result: PASS (function executed without error)")
-        return True
+        # Let notifications from earlier tests finish before stubbing out the
+        # notifier backend, so no real notification is posted;
+        # send_notification itself still runs end to end on the event loop
+        flush_notifications()
+        with patch.object(NOTIFIER, 'send', new_callable=AsyncMock) as send:
+            send_notification("Test Title", "Test Message").result(timeout=5)
+        
+        if send.await_args_list.count(call(title="Test Title", message="Test Message")) == 1:
+            log("  Result: PASS (notification handed to the notifier)")
+            return True
+        log(f"  Result: FAIL (notifier calls: {send.await_args_list})")
+        return False
     except Exception as e:
-        print(f"  Result: FAIL ({e})")
+        log(f"  Result: FAIL ({e})")
         return False
 
 def test_handler_creation():
     """Test file handler creation."""
-    print("\nTest 4: File handler creation")
+    log("\nTest 4: File handler creation")
     try:
         handler = DesktopVideoHandler()
-        print("  Result: PASS (handler created successfully)")
+        log("  Result: PASS (handler created successfully)")
         return True
     except Exception as e:
-        print(f"  Result: FAIL ({e})")
+        log(f"  Result: FAIL ({e})")
         return False
 
 def test_file_filtering():
     """Test that handler correctly identifies supported video files."""
-    print("\nTest 5: File filtering logic")
+    log("\nTest 5: File filtering logic")
     try:
-        # This is a simple logic test
-        test_cases = [
-            ("test.mov", True),
-            ("test.MOV", True),
-            ("test.mp4", True),
-            ("test.MP4", True),
-            ("test.m4v", True),
-            ("test.avi", True),
-            ("test.mkv", True),
-            ("test.webm", True),
-            ("test.flv", True),
-            ("test.wmv", True),
-            ("test.txt", False),
-            ("test.jpg", False),
-            ("test.pdf", False),
-            ("test_compressed.mov", False),
-            ("test_compressed.mp4", False),
-        ]
-        
         all_passed = True
-        for filename, should_process in test_cases:
-            is_supported = Path(filename).suffix.lower() in SUPPORTED_VIDEO_EXTENSIONS
-            is_compressed = '_compressed' in filename
-            would_process = is_supported and not is_compressed
+        for filename, should_process in _CASES:
+            would_process = _PRED.match(filename) is not None
             
             if would_process == should_process:
-                print(f"  ✓ {filename}: {'process' if should_process else 'skip'}")
+                log('  ✓ ' + filename + ':' + (_PROC if should_process else _SKIP))
             else:
-                print(f"  ✗ {filename}: expected {'process' if should_process else 'skip'}, got {'process' if would_process else 'skip'}")
+                log(f"  ✗ {filename}: expected {'process' if should_process else 'skip'}, got {'process' if would_process else 'skip'}")
                 all_passed = False
         
-        print(f"  Result: {'PASS' if all_passed else 'FAIL'}")
+        # The same cases as real watchdog events through the service's handler;
+        # the parent directory has a dot to check only the name is considered
+        handler = DesktopVideoHandler()
+        queued = []
+        handler.queue_video = queued.append
+        desktop = os.path.join(os.sep, 'Users', 'test.user', 'Desktop')
+        for filename, should_process in _CASES:
+            queued.clear()
+            handler.dispatch(FileCreatedEvent(os.path.join(desktop, filename)))
+            if bool(queued) != should_process:
+                log(f"  ✗ handler {filename}: expected {'process' if should_process else 'skip'}")
+                all_passed = False
+        
+        queued.clear()
+        handler.dispatch(DirCreatedEvent(os.path.join(desktop, 'folder.mov')))
+        if queued:
+            log("  ✗ handler folder.mov: expected directories to be skipped")
+            all_passed = False
+        
+        if all_passed:
+            log(f"  ✓ handler agrees on all {len(_CASES)} cases and skips directories")
+        log(f"  Result: {'PASS' if all_passed else 'FAIL'}")
         return all_passed
     except Exception as e:
-        print(f"  Result: FAIL ({e})")
+        log(f"  Result: FAIL ({e})")
         return False
 
+# Outcome of the trash test for each (move_to_trash result, file removed) pair
+_VERDICT = {
+    (True, True): (True, "  Result: PASS (file moved to trash successfully)"),
+    (False, True): (True, "  Result: PASS (function executed, file removed)"),
+    (False, False): (True, "  Result: PASS (function executed without error, expected in test environment)"),
+    (True, False): (False, "  Result: FAIL (unexpected state)"),
+}
+
 def test_move_to_trash():
     """Test move_to_trash function with a temporary file."""
-    print("\nTest 6: Move to trash functionality")
+    log("\nTest 6: Move to trash functionality")
+    tmp_path = None
     try:
         # Create a temporary file
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as tmp_file:
-            tmp_path = Path(tmp_file.name)
-            tmp_file.write("Test content for trash")
-        
-        # Verify file exists
-        if not tmp_path.exists():
-            print(f"  Result: FAIL (temp file not created)")
-            return False
+        fd, tmp_name = tempfile.mkstemp(suffix='.txt')
+        tmp_path = Path(tmp_name)
+        os.write(fd, b"Test content for trash")
+        os.close(fd)
         
         # Try to move to trash
         result = move_to_trash(tmp_path)
         
         # Check if file was removed (either moved to trash or deleted)
-        file_removed = not tmp_path.exists()
+        try:
+            os.stat(tmp_name)
+            file_removed = False
+        except FileNotFoundError:
+            file_removed = True
         
-        if result and file_removed:
-            print(f"  Result: PASS (file moved to trash successfully)")
-            return True
-        elif not result and file_removed:
-            print(f"  Result: PASS (function executed, file removed)")
-            return True
-        elif not result and not file_removed:
-            # Clean up if not removed
-            if tmp_path.exists():
-                tmp_path.unlink()
-            print(f"  Result: PASS (function executed without error, expected in test environment)")
-            return True
-        else:
-            # Clean up
-            if tmp_path.exists():
-                tmp_path.unlink()
-            print(f"  Result: FAIL (unexpected state)")
-            return False
-            
+        # Clean up if not removed
+        if not file_removed:
+            tmp_path.unlink(missing_ok=True)
+        
+        passed, message = _VERDICT[(bool(result), file_removed)]
+        log(message)
+        return passed
     except Exception as e:
-        print(f"  Result: FAIL ({e})")
+        log(f"  Result: FAIL ({e})")
         # Try to clean up
         try:
-            if 'tmp_path' in locals() and tmp_path.exists():
-                tmp_path.unlink()
+            if tmp_path is not None:
+                tmp_path.unlink(missing_ok=True)
         except:
             pass
         return False
 
+def test_wait_until_stable():
+    """Test that a finished file is reported as stable."""
+    log("\nTest 7: Wait until file is stable")
+    try:
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.mov', delete=False) as tmp_file:
+            tmp_path = Path(tmp_file.name)
+            tmp_file.write("Test video content")
+        
+        stable = asyncio.run(wait_until_stable(tmp_path, interval=0.01, timeout=5))
+        tmp_path.write_text("")
+        empty = asyncio.run(wait_until_stable(tmp_path, interval=0.01, timeout=0.1))
+        tmp_path.unlink()
+        missing = asyncio.run(wait_until_stable(tmp_path, interval=0.01, timeout=5))
+        
+        if stable and not empty and not missing:
+            log("  Result: PASS (stable file detected, empty and missing files rejected)")
+            return True
+        log(f"  Result: FAIL (stable={stable}, empty={empty}, missing={missing})")
+        return False
+    except Exception as e:
+        log(f"  Result: FAIL ({e})")
+        return False
+
+def test_find_existing_videos():
+    """Test the startup sweep for videos already on the Desktop."""
+    log("\nTest 8: Find existing videos")
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ("clip.mov", "CLIP2.MP4", "clip_compressed.mov", "._clip.mov", "notes.txt"):
+                Path(tmp_dir, name).write_text("Test content")
+            Path(tmp_dir, "folder.mov").mkdir()
+            
+            found = sorted(path.name for path in find_existing_videos(tmp_dir))
+        
+        if found == ["CLIP2.MP4", "clip.mov"]:
+            log(f"  Result: PASS (found {', '.join(found)})")
+            return True
+        log(f"  Result: FAIL (found {found})")
+        return False
+    except Exception as e:
+        log(f"  Result: FAIL ({e})")
+        return False
+
+def test_notification_coalescing():
+    """Test that waiting notifications collapse to the latest, keeping errors."""
+    log("\nTest 9: Notification coalescing")
+    delivered = []
+    
+    async def slow_send(title, message):
+        delivered.append(message)
+        await asyncio.sleep(0.05)
+    
+    try:
+        flush_notifications()
+        with patch.object(NOTIFIER, 'send', new=slow_send):
+            # The first is sent at once; the rest wait behind it
+            send_notification("Test", "Starting A")
+            send_notification("Test - Error", "Failed B", error=True)
+            replaced = send_notification("Test", "Starting C")
+            send_notification("Test - Error", "Failed D", error=True)
+            send_notification("Test", "Starting E")
+            idle = flush_notifications()
+        
+        expected = ["Starting A", "Failed B", "Failed D", "Starting E"]
+        if idle and delivered == expected and replaced.cancelled():
+            log("  Result: PASS (errors kept in order, ordinary messages collapsed)")
+            return True
+        log(f"  Result: FAIL (idle={idle}, delivered={delivered}, replaced={replaced})")
+        return False
+    except Exception as e:
+        log(f"  Result: FAIL ({e})")
+        return False
+
+def test_encode_lock():
+    """Test that two holders of the encode lock for one output exclude each other."""
+    log("\nTest 10: Encode lock")
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, "clip_compressed.mov")
+            lock_path = os.path.join(tmp_dir, ".clip_compressed.mov.lock")
+            
+            with encode_lock(output_path) as first:
+                with encode_lock(output_path) as second:
+                    pass
+            lock_removed = not os.path.exists(lock_path)
+            
+            with encode_lock(output_path) as again:
+                pass
+        
+        if first and not second and lock_removed and again:
+            log("  Result: PASS (second holder refused, lock released and reusable)")
+            return True
+        log(f"  Result: FAIL (first={first}, second={second}, lock_removed={lock_removed}, again={again})")
+        return False
+    except Exception as e:
+        log(f"  Result: FAIL ({e})")
+        return False
+
+def test_mount_detection():
+    """Test reading filesystem types from `mount` output and spotting cloud folders."""
+    log("\nTest 11: Network and cloud folder detection")
+    # (mount line, mount point, expected type, expected to be local)
+    cases = [
+        ("/dev/disk3s5 on /System/Volumes/Data (apfs, local, journaled, nobrowse)",
+         "/System/Volumes/Data", "apfs", True),
+        ("//me@nas/share on /Volumes/share (smbfs, nodev, nosuid, mounted by me)",
+         "/Volumes/share", "smbfs", False),
+        ("sshfs@macfuse0 on /Volumes/remote (macfuse, nodev, nosuid, synchronous, mounted by me)",
+         "/Volumes/remote", "macfuse", False),
+        ("//me@nas/My Videos on /Volumes/My Videos (smbfs, nodev, nosuid, mounted by me)",
+         "/Volumes/My Videos", "smbfs", False),
+        ("nas:/export on /mnt/nfs type nfs4 (rw,relatime,vers=4.2)",
+         "/mnt/nfs", "nfs4", False),
+        ("me@host:/ on /mnt/ssh type fuse.sshfs (rw,nosuid,nodev,user_id=1000)",
+         "/mnt/ssh", "fuse.sshfs", False),
+        ("/dev/sdb1 on /media/me/USB Drive type vfat (rw,nosuid,nodev)",
+         "/media/me/USB Drive", "vfat", True),
+    ]
+    try:
+        mount_output = "\n".join(line for line, *_ in cases)
+        failures = []
+        for _, mount_point, expected_type, local in cases:
+            fs_type = mount_fs_type(mount_output, mount_point)
+            if fs_type != expected_type or (fs_type not in NETWORK_FS_TYPES) != local:
+                failures.append(f"{mount_point}: {fs_type}")
+        if mount_fs_type(mount_output, "/Volumes") is not None:
+            failures.append("/Volumes: matched a mount it is not")
+        
+        icloud_desktop = CLOUD_STORAGE_DIRS[0] / 'com~apple~CloudDocs' / 'Desktop'
+        if is_local_fs(icloud_desktop):
+            failures.append(f"{icloud_desktop}: reported as local")
+        
+        if not failures:
+            log(f"  Result: PASS ({len(cases)} mount lines and an iCloud Drive folder classified)")
+            return True
+        log(f"  Result: FAIL ({'; '.join(failures)})")
+        return False
+    except Exception as e:
+        log(f"  Result: FAIL ({e})")
+        return False
+
+def test_dedup_index():
+    """Test recording and finding earlier outputs in the dedup index."""
+    log("\nTest 12: Duplicate video index")
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                patch('desktop_video_compress.DEDUP_DB_PATH', Path(tmp_dir, 'index', 'dedup.sqlite')):
+            video = Path(tmp_dir, "clip.mov")
+            video.write_bytes(os.urandom(300 * 1024))
+            output = Path(tmp_dir, "clip_compressed.mov")
+            output.write_bytes(b"compressed")
+            
+            fingerprint = video_fingerprint(video)
+            # Without hashlib.file_digest a small file is hashed through mmap
+            with patch('desktop_video_compress.hashlib', SimpleNamespace(sha256=hashlib.sha256)):
+                mapped = video_fingerprint(video)
+            
+            unknown = find_previous_output(fingerprint) is None
+            record_output(fingerprint, output)
+            found = find_previous_output(fingerprint) == output
+            
+            st = video.stat()
+            os.utime(video, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            touched_missed = find_previous_output(video_fingerprint(video)) is None
+            
+            output.unlink()
+            removed_missed = find_previous_output(fingerprint) is None
+        
+        checks = {
+            "same digest via mmap": fingerprint == mapped,
+            "unknown before recording": unknown,
+            "found after recording": found,
+            "missed after mtime change": touched_missed,
+            "missed once output removed": removed_missed,
+        }
+        failed = [name for name, ok in checks.items() if not ok]
+        if not failed:
+            log("  Result: PASS (hit after recording; misses on new mtime or removed output)")
+            return True
+        log(f"  Result: FAIL ({', '.join(failed)})")
+        return False
+    except Exception as e:
+        log(f"  Result: FAIL ({e})")
+        return False
+
+def test_handbrake_cache():
+    """Test that the saved HandBrake check is only reused for the same binary."""
+    log("\nTest 13: HandBrake check cache")
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                patch('desktop_video_compress.HANDBRAKE_CACHE_PATH', Path(tmp_dir, 'cache', 'handbrake.json')) as cache_path:
+            binary = Path(tmp_dir, "HandBrakeCLI")
+            binary.write_text("#!/bin/sh\n")
+            
+            save_handbrake_cache(str(binary), "HandBrake 1.7.0", SOFTWARE_ENCODER)
+            cached = load_handbrake_cache()
+            hit = cached is not None and cached['path'] == str(binary) and cached['encoder'] == SOFTWARE_ENCODER
+            
+            st = binary.stat()
+            os.utime(binary, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            mtime_rejected = load_handbrake_cache() is None
+            
+            # An upgrade that swaps in a new file but keeps the old mtime
+            save_handbrake_cache(str(binary), "HandBrake 1.7.0", SOFTWARE_ENCODER)
+            st = binary.stat()
+            replacement = Path(tmp_dir, "HandBrakeCLI.new")
+            replacement.write_text("#!/bin/sh\n")
+            os.utime(replacement, ns=(st.st_atime_ns, st.st_mtime_ns))
+            os.replace(replacement, binary)
+            inode_rejected = load_handbrake_cache() is None
+            
+            save_handbrake_cache(str(binary), "HandBrake 1.7.0", SOFTWARE_ENCODER)
+            cached = json.loads(cache_path.read_text())
+            cache_path.write_text(json.dumps({**cached, 'encoder': 'unknown_encoder'}))
+            encoder_rejected = load_handbrake_cache() is None
+            
+            cache_path.write_text('{"path": ')
+            corrupt_rejected = load_handbrake_cache() is None
+        
+        checks = {
+            "hit": hit,
+            "changed mtime": mtime_rejected,
+            "changed inode": inode_rejected,
+            "unknown encoder": encoder_rejected,
+            "corrupt JSON": corrupt_rejected,
+        }
+        failed = [name for name, ok in checks.items() if not ok]
+        if not failed:
+            log("  Result: PASS (reused for the same binary, rejected otherwise)")
+            return True
+        log(f"  Result: FAIL ({', '.join(failed)})")
+        return False
+    except Exception as e:
+        log(f"  Result: FAIL ({e})")
+        return False
+
 def main():
     """Run all tests."""
-    print("=" * 60)
-    print("Desktop Video Compress - Test Suite")
-    print("=" * 60)
-    
     tests = [
         test_handbrake_check,
         test_find_handbrake,
@@ -161,21 +507,57 @@ def main():
         test_handler_creation,
         test_file_filtering,
         test_move_to_trash,
+        test_wait_until_stable,
+        test_find_existing_videos,
+        test_notification_coalescing,
+        test_encode_lock,
+        test_mount_detection,
+        test_dedup_index,
+        test_handbrake_cache,
     ]
     
-    results = []
-    for test_func in tests:
-        try:
-            results.append(test_func())
-        except Exception as e:
-            print(f"\nTest {test_func.__name__} raised exception: {e}")
-            results.append(False)
+    # Tests that touch the notifier or patch module globals run one after
+    # another; the rest only use their own temporary files
+    serial_tests = {
+        test_handbrake_check,
+        test_find_handbrake,
+        test_notification,
+        test_notification_coalescing,
+        test_dedup_index,
+        test_handbrake_cache,
+    }
+    
+    # Run the filesystem tests side by side while the others run in turn
+    with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+        futures = {
+            test_func: executor.submit(run_test, test_func)
+            for test_func in tests if test_func not in serial_tests
+        }
+        serial_outcomes = {
+            test_func: run_test(test_func)
+            for test_func in tests if test_func in serial_tests
+        }
+        outcomes = [
+            serial_outcomes[test_func] if test_func in serial_tests
+            else futures[test_func].result()
+            for test_func in tests
+        ]
     
-    print("\n" + "=" * 60)
-    print(f"Tests passed: {sum(results)}/{len(results)}")
-    print("=" * 60)
+    # Bit i is set when test i passed
+    mask = 0
+    for i, (result, lines) in enumerate(outcomes):
+        _LOG.extend(lines)
+        mask |= int(bool(result)) << i
     
-    return all(results)
+    # Write the report as bytes, encoding the test output in one go
+    out = sys.stdout.buffer.write
+    out(_BANNER + _TITLE + _BANNER)
+    out(('\n'.join(_LOG) + '\n\n').encode('utf-8'))
+    out(_BANNER)
+    out(f"Tests passed: {bin(mask).count('1')}/{len(tests)}\n".encode('utf-8'))
+    out(_BANNER)
+    sys.stdout.buffer.flush()
+    return mask == (1 << len(tests)) - 1
 
 if __name__ == '__main__':
     success = main()